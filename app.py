@@ -1,5 +1,14 @@
 import streamlit as st
 import os
+import logging
+import threading
+import time
+import sqlite3
+import uuid
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+from types import SimpleNamespace
 
 # --- APP VERSION ---
 VERSION = "2.5.0 (Clean Light Theme)"
@@ -21,225 +30,74 @@ if 'last_draw' not in st.session_state:
     st.session_state.last_draw = None
 if 'map_id' not in st.session_state:
     st.session_state.map_id = 0
+if 'session_uid' not in st.session_state:
+    st.session_state.session_uid = uuid.uuid4().hex
 
 # 2. Lazy Imports
+# Only streamlit/pandas load at startup. The GIS stack (geopandas, pyogrio, shapely, folium...) is imported
+# the first time a section map or coordinate search needs it; set GIS_EAGER_IMPORTS=1 to pay that cost at boot instead.
+import traceback
 try:
-    import geopandas as gpd
     import pandas as pd
-    import folium
-    from folium.plugins import LocateControl, Draw, Fullscreen
-    from streamlit_folium import st_folium
-    import traceback
-    from shapely.geometry import shape, Point
-    from pyproj import Transformer
-    from branca.element import MacroElement
-    from jinja2 import Template
-
-# --- Config & Setup ---
 except Exception as e:
     st.error(f"❌ خطأ في تحميل المكتبات: {e}")
     st.stop()
 
-# --- Map Control Class ---
-class ClearButton(MacroElement):
-    _template = Template("""
-        {% macro script(this, kwargs) %}
-            var clearBtn = L.Control.extend({
-                options: { position: 'topright' },
-                onAdd: function (map) {
-                    var container = L.DomUtil.create('div', 'leaflet-bar leaflet-control leaflet-control-custom');
-                    container.style.backgroundColor = 'white'; 
-                    container.style.width = '30px'; 
-                    container.style.height = '30px';
-                    container.style.cursor = 'pointer';
-                    container.innerHTML = '<a href="?clear_selection=true" title="محو التحديد" style="display:flex; align-items:center; justify-content:center; width:100%; height:100%; text-decoration:none; color:black; font-weight:bold; font-size:18px;">❌</a>';
-                    return container;
-                }
-            });
-            map.addControl(new clearBtn());
-        {% endmacro %}
-    """)
-
+def load_gis_libs():
+    # Python's module cache makes every call after the first one cheap
+    try:
+        import geopandas as gpd
+        import folium
+        from folium.plugins import LocateControl, Draw, Fullscreen
+        from streamlit_folium import st_folium
+        from shapely.geometry import shape
+    except Exception as e:
+        st.error(f"❌ خطأ في تحميل المكتبات: {e}")
+        st.stop()
+    return SimpleNamespace(gpd=gpd, folium=folium, LocateControl=LocateControl, Draw=Draw,
+                           Fullscreen=Fullscreen, st_folium=st_folium, shape=shape)
+
+if os.environ.get("GIS_EAGER_IMPORTS") == "1":
+    load_gis_libs()
 
-# 3. Custom Premium CSS (Matching Mockup)
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;700&display=swap');
-    
-    /* Global Styles */
-    html, body, [class*="css"] { 
-        font-family: 'Cairo', 'Inter', sans-serif; 
-        direction: rtl; 
-        text-align: right; 
-        color: #0f172a; /* Slate 900 */
-    }
-    .stApp { 
-        background-color: #f8fafc; /* Slate 50 */
-        color: #0f172a; 
-        background-image: 
-            radial-gradient(at 0% 0%, rgba(37, 99, 235, 0.03) 0px, transparent 50%),
-            radial-gradient(at 100% 0%, rgba(16, 185, 129, 0.03) 0px, transparent 50%);
-        background-attachment: fixed;
-    }
-    
-    /* Top White Header Bar */
-    .top-header {
-        position: fixed;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 60px;
-        background-color: rgba(255, 255, 255, 0.9);
-        backdrop-filter: blur(10px);
-        color: #0f172a;
-        display: flex;
-        align-items: center;
-        justify-content: flex-start;
-        padding-left: 24px;
-        font-weight: 800;
-        z-index: 1000;
-        box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-        border-bottom: 1px solid #e2e8f0; /* Slate 200 */
-    }
-    .main .block-container { padding-top: 80px; }
-
-    /* Main Title Styling */
-    .main-title {
-        color: #0f172a; /* Slate 900 */
-        font-size: 2.5rem;
-        font-weight: 800;
-        margin-bottom: 24px;
-        display: flex;
-        align-items: center;
-        justify-content: flex-start;
-        gap: 15px;
-        direction: ltr; /* Force LTR for English/Mixed title */
-        letter-spacing: -0.025em;
-    }
-    .status-dot {
-        height: 12px;
-        width: 12px;
-        background-color: #10b981; /* Emerald 500 */
-        border-radius: 50%;
-        display: inline-block;
-        box-shadow: 0 0 0 4px rgba(16, 185, 129, 0.2);
-    }
+# --- Map Control Class ---
+CLEAR_BUTTON_JS = """
+    {% macro script(this, kwargs) %}
+        var clearBtn = L.Control.extend({
+            options: { position: 'topright' },
+            onAdd: function (map) {
+                var container = L.DomUtil.create('div', 'leaflet-bar leaflet-control leaflet-control-custom');
+                container.style.backgroundColor = 'white'; 
+                container.style.width = '30px'; 
+                container.style.height = '30px';
+                container.style.cursor = 'pointer';
+                container.innerHTML = '<a href="?clear_selection=true" title="محو التحديد" style="display:flex; align-items:center; justify-content:center; width:100%; height:100%; text-decoration:none; color:black; font-weight:bold; font-size:18px;">❌</a>';
+                return container;
+            }
+        });
+        map.addControl(new clearBtn());
+    {% endmacro %}
+"""
+
+def make_clear_button():
+    # branca/jinja2 ship with folium - only touch them once a map is being built
+    from branca.element import MacroElement
+    from jinja2 import Template
 
-    /* Control Elements Container (Card Style) */
-    .controls-header {
-        background-color: #ffffff;
-        color: #0f172a;
-        padding: 20px 24px 10px;
-        border-radius: 1.5rem 1.5rem 0 0;
-        font-weight: 700;
-        font-size: 1.1rem;
-        display: flex;
-        align-items: center;
-        gap: 10px;
-        margin-bottom: 0;
-        border: 1px solid #eff6ff;
-        border-bottom: none;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.02), 0 2px 4px -1px rgba(0, 0, 0, 0.02);
-    }
-    .controls-body {
-        background-color: #ffffff;
-        border: 1px solid #eff6ff;
-        border-top: none;
-        padding: 0 24px 24px;
-        border-radius: 0 0 1.5rem 1.5rem;
-        margin-bottom: 30px;
-        box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.02), 0 4px 6px -2px rgba(0, 0, 0, 0.02);
-    }
+    class ClearButton(MacroElement):
+        _template = Template(CLEAR_BUTTON_JS)
+    return ClearButton()
 
-    /* Input Styling */
-    .stSelectbox label, .stMultiSelect label, .stTextInput label, .stRadio label { 
-        color: #475569 !important; /* Slate 600 */
-        font-size: 0.9rem !important; 
-        font-weight: 600 !important;
-    }
-    div[data-baseweb="select"] { 
-        background-color: #f8fafc !important; 
-        border: 1px solid #cbd5e1 !important;
-        border-radius: 0.75rem !important; 
-    }
-    div[data-baseweb="select"]:hover { border-color: #94a3b8 !important; }
-    div[data-baseweb="select"] * { color: #0f172a !important; }
-    
-    /* Text Input */
-    input[type="text"] {
-        background-color: #f8fafc !important;
-        color: #0f172a !important;
-        border: 1px solid #cbd5e1 !important;
-        border-radius: 0.75rem !important;
-    }
-    input[type="text"]:focus {
-        border-color: #3b82f6 !important; /* Blue 500 */
-        box-shadow: 0 0 0 2px rgba(59, 130, 246, 0.2) !important;
-    }
-    
-    /* Horizontal Legend */
-    .legend-container {
-        display: flex;
-        justify-content: center;
-        gap: 32px;
-        margin: 20px 0;
-        padding: 16px;
-        background: #ffffff;
-        border-radius: 1rem;
-        border: 1px solid #e2e8f0;
-        flex-wrap: wrap;
-    }
-    .legend-item { 
-        display: flex; 
-        align-items: center; 
-        gap: 8px; 
-        font-weight: 600; 
-        font-size: 0.9rem; 
-        color: #475569; 
-    }
-    .dot { height: 10px; width: 10px; border-radius: 50%; display: inline-block; }
-    
-    /* Search Button Valid Styling */
-    div[data-testid="stFormSubmitButton"] button {
-        background-color: #2563eb !important; /* Blue 600 */
-        color: white !important;
-        border-radius: 0.75rem !important;
-        border: none !important;
-        padding: 0.5rem 1.5rem !important;
-        font-size: 1rem !important;
-        font-weight: 700 !important;
-        box-shadow: 0 1px 3px rgba(0,0,0,0.1) !important;
-        transition: all 0.2s !important;
-        width: 100%;
-    }
-    div[data-testid="stFormSubmitButton"] button:hover {
-        background-color: #1d4ed8 !important; /* Blue 700 */
-        transform: translateY(-1px);
-        box-shadow: 0 4px 6px -1px rgba(37, 99, 235, 0.3) !important;
-    }
 
-    /* Generic Button Styling */
-    .stButton button {
-        border-radius: 0.75rem !important;
-        border: 1px solid #e2e8f0 !important;
-        color: #475569 !important;
-        background-color: #ffffff !important;
-        font-weight: 600 !important;
-    }
-    .stButton button:hover {
-        border-color: #cbd5e1 !important;
-        background-color: #f8fafc !important;
-        color: #0f172a !important;
-    }
-
-    /* Maps & Dataframes */
-    iframe { border-radius: 1.5rem !important; border: 1px solid #e2e8f0 !important; box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.05); }
-    div[data-testid="stDataFrame"] { border-radius: 1rem !important; overflow: hidden !important; border: 1px solid #e2e8f0 !important; }
+# 3. Custom Premium CSS (Matching Mockup)
+# Served from ./static (server.enableStaticServing) so reruns only send a <link>, not the whole stylesheet
+@st.cache_resource
+def static_asset_url(name):
+    # mtime as cache-buster: browsers keep the file cached until it actually changes
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", name)
+    return f"app/static/{name}?v={int(os.path.getmtime(path))}"
 
-    /* Hide Sidebar elements if any */
-    [data-testid="stSidebar"] { background-color: #ffffff !important; border-left: 1px solid #e2e8f0 !important; }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(f'<link rel="stylesheet" href="{static_asset_url("app.css")}">', unsafe_allow_html=True)
 
 # 4. Helpers
 def get_color(status):
@@ -249,26 +107,184 @@ def get_color(status):
     if 'مراجعة' in status: return '#FFD600'  # Yellow
     return '#2196F3'  # Blue for others
 
-def get_assets_path():
+@st.cache_resource(ttl=600)
+def scan_assets():
+    # Memoized: the script re-runs on every interaction, the data directory does not change that often
     possible = ["assets/gis", ".", "gis_service/assets/gis"]
     for p in possible:
-        if os.path.exists(p) and any(f.endswith('.gpkg') for f in os.listdir(p)):
-            return p
-    return "."
+        if os.path.exists(p):
+            files = tuple(f for f in os.listdir(p) if f.endswith('.gpkg'))
+            if files: return p, files
+    return ".", ()
+
+ASSETS_PATH, DATA_FILES = scan_assets()
+
+# 5. Shared Data Layer
+# st.cache_data pickles a fresh copy of the frame for every reader. Frames here are loaded once per
+# instance; each session gets a shallow copy, which under copy-on-write shares the stored buffers but
+# turns any write (new column, in-place edit) into a private copy - the stored frame never changes.
+if pd.__version__.split('.')[0] == '2':
+    # pandas 3 always copies on write; on 2.x opt in so derived frames never write back into shared ones
+    pd.set_option("mode.copy_on_write", True)
+
+logger = logging.getLogger("gis_viewer")
+if not logger.handlers:  # module re-runs on every interaction; configure once per process
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def _session_view(value):
+    # Shallow copies are cheap (no data copied); nested tuples/dicts are walked so every frame is covered
+    if isinstance(value, pd.DataFrame): return value.copy(deep=False)
+    if isinstance(value, tuple): return tuple(_session_view(v) for v in value)
+    if isinstance(value, dict): return {k: _session_view(v) for k, v in value.items()}
+    return value
+
+class SharedDataStore:
+    """Instance-wide store of read-only frames, shared by all sessions."""
+
+    def __init__(self, ttl=3600, max_entries=32, session_window=900):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.session_window = session_window
+        self._guard = threading.Lock()
+        self._locks = {}                # key -> Lock (one loader per key at a time)
+        self._entries = OrderedDict()   # key -> (expires_at, value), least recently used first
+        self._sessions = {}             # key -> {session_uid: last_seen}
+
+    def _lock_for(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _evict(self, key):
+        # Caller holds _guard
+        self._entries.pop(key, None)
+        lock = self._locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._locks[key]
+
+    def _purge(self):
+        # Caller holds _guard: drop expired entries, then least recently used ones over the cap
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            self._evict(key)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _fresh(self, key):
+        with self._guard:
+            self._purge()
+            entry = self._entries.get(key)
+            if entry: self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key, loader, ttl=-1):
+        """Shared value for `key`, loaded once. `ttl=None` keeps it until evicted (e.g. versioned keys)."""
+        ttl = self.ttl if ttl == -1 else ttl
+        entry = self._fresh(key)
+        if entry: return _session_view(entry[1])
+        # Concurrent misses on the same key wait here instead of loading the file twice
+        with self._lock_for(key):
+            entry = self._fresh(key)
+            if entry: return _session_view(entry[1])
+            value = loader()
+            with self._guard:
+                self._entries[key] = (float('inf') if ttl is None else time.time() + ttl, value)
+                self._purge()
+            return _session_view(value)
+
+    def discard(self, match):
+        """Evict every entry whose key satisfies `match(key)`."""
+        with self._guard:
+            for key in [k for k in self._entries if match(k)]:
+                self._evict(key)
+
+    def touch(self, key, session_uid):
+        with self._guard:
+            sessions = self._sessions.setdefault(key, {})
+            is_new = session_uid not in sessions
+            sessions[session_uid] = time.time()
+        if is_new:
+            logger.info("session %s joined %s (%d active on this key, %d on instance)",
+                        session_uid[:8], key, self.session_count(key), self.session_count())
+
+    def _prune_sessions(self):
+        # Caller holds _guard. Session maps age out on their own window, independent of entry eviction
+        cutoff = time.time() - self.session_window
+        for k, sessions in list(self._sessions.items()):
+            for uid in [u for u, seen in sessions.items() if seen < cutoff]:
+                del sessions[uid]
+            if not sessions: del self._sessions[k]
+
+    def session_count(self, key=None):
+        """Sessions seen within `session_window` - for one key, or across the whole instance."""
+        with self._guard:
+            self._prune_sessions()
+            if key is not None:
+                return len(self._sessions.get(key, {}))
+            return len({uid for sessions in self._sessions.values() for uid in sessions})
+
+    def stats(self):
+        """Diagnostics snapshot: cached keys and active sessions per key."""
+        with self._guard:
+            self._prune_sessions()
+            return {
+                'entries': [str(k) for k in self._entries],
+                'sessions': {str(k): len(v) for k, v in self._sessions.items()},
+                'active_sessions': len({uid for v in self._sessions.values() for uid in v}),
+            }
+
+@st.cache_resource
+def get_data_store():
+    return SharedDataStore()
+
+def _gpkg_connect(path):
+    return closing(sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True))
+
+def _gpkg_feature_table(con):
+    # Deterministic (registration order) so every reader - sqlite3 or GDAL - targets the same layer
+    return con.execute("SELECT table_name FROM gpkg_contents WHERE data_type = 'features' ORDER BY rowid LIMIT 1").fetchone()[0]
+
+def gpkg_layer(path):
+    """Name of the feature layer the app reads - pass as `layer=` to gpd.read_file."""
+    with _gpkg_connect(path) as con:
+        return _gpkg_feature_table(con)
+
+def read_gpkg_attributes(path, columns):
+    """Attribute columns straight from the GeoPackage's SQLite feature table (no GDAL/geopandas import)."""
+    quote = lambda name: '"' + name.replace('"', '""') + '"'
+    with _gpkg_connect(path) as con:
+        table = _gpkg_feature_table(con)
+        existing = {row[1] for row in con.execute(f"PRAGMA table_info({quote(table)})")}
+        cols = [c for c in columns if c in existing]
+        if not cols: return pd.DataFrame()
+        return pd.read_sql_query(f"SELECT {', '.join(map(quote, cols))} FROM {quote(table)}", con)
+
+def _to_arrow_strings(df, cols):
+    # Arrow-backed strings: immutable buffers, far smaller than Python str objects. Missing values stay <NA>
+    for col in cols:
+        if col in df.columns:
+            df[col] = df[col].astype("string[pyarrow]")
+    return df
 
-ASSETS_PATH = get_assets_path()
-
-# 5. Data Loading
-@st.cache_data(ttl=3600)
 def load_meta(file_name, base_path):
-    path = os.path.join(base_path, file_name)
-    return gpd.read_file(path, engine='pyogrio', columns=['gov', 'sec', 'requestnumber'], use_arrow=True)
-
-@st.cache_data(ttl=3600)
-def load_map_data(file_name, base_path, gov, sec):
+    def _load():
+        # The dropdowns need neither geometry nor the GIS stack
+        meta = read_gpkg_attributes(os.path.join(base_path, file_name), ['gov', 'sec', 'requestnumber'])
+        # Ensure requestnumber is text for searching (matches the section frames)
+        meta['requestnumber'] = meta['requestnumber'].astype(str)
+        return _to_arrow_strings(meta, ['gov', 'sec', 'requestnumber'])
+    key = ("meta", file_name, base_path)
+    get_data_store().touch(key, st.session_state.session_uid)
+    return get_data_store().get(key, _load)
+
+def _read_map_data(file_name, base_path, gov, sec):
+    gpd = load_gis_libs().gpd
     path = os.path.join(base_path, file_name)
     where = f"gov = '{gov}' AND sec = '{sec}'"
-    gdf = gpd.read_file(path, engine='pyogrio', where=where, use_arrow=True)
+    gdf = gpd.read_file(path, engine='pyogrio', layer=gpkg_layer(path), where=where, use_arrow=True)
     # Capture Original CRS & Bounds for Validation
     original_crs = gdf.crs
     original_bounds = gdf.total_bounds # (minx, miny, maxx, maxy)
@@ -287,10 +303,134 @@ def load_map_data(file_name, base_path, gov, sec):
             try:
                 gdf[col] = gdf[col].apply(lambda x: x.isoformat() if hasattr(x, 'isoformat') else x)
             except: pass
-            
-    return gdf, original_crs, original_bounds
 
-# 6. Main App
+    gdf = _to_arrow_strings(gdf, ['requestnumber', 'status_color'])
+
+    # Lightweight copy ONLY for the map to prevent ArrayMemoryError (cached with, and expires with, its section)
+    keep_map_cols = ['requestnumber', 'survey_review_status', 'accepted_date', 'status_color', 'geometry']
+    gdf_map = gdf[[c for c in keep_map_cols if c in gdf.columns]].copy()
+    # Micro-simplification (0.00001 is ~1m). Preserves look, saves RAM.
+    gdf_map['geometry'] = gdf_map['geometry'].simplify(0.00001, preserve_topology=True)
+    return gdf, original_crs, original_bounds, gdf_map
+
+def _load_section(file_name, base_path, gov, sec):
+    key = ("section", file_name, base_path, gov, sec)
+    get_data_store().touch(key, st.session_state.session_uid)
+    return get_data_store().get(key, lambda: _read_map_data(file_name, base_path, gov, sec))
+
+def load_map_data(file_name, base_path, gov, sec):
+    return _load_section(file_name, base_path, gov, sec)[:3]
+
+def load_map_view(file_name, base_path, gov, sec):
+    """Simplified copy of a section for Folium (shared, stored in the same entry as the full frame)."""
+    return _load_section(file_name, base_path, gov, sec)[3]
+
+# 6. Status Analytics (aggregates only - no geometry)
+AGG_DIMS = ['gov', 'sec', 'survey_review_status', 'comcode']
+AGG_AREAS = ['area_land', 'area_build', 'totalarea']
+AGG_LABELS = {
+    'gov': 'المحافظة', 'sec': 'القسم', 'survey_review_status': 'حالة مراجعة المسح',
+    'comcode': 'كود الشركة', 'count': 'عدد الطلبات', 'month': 'الشهر',
+    'area_land': 'مساحة الأرض', 'area_build': 'مساحة المبنى', 'totalarea': 'المساحة الإجمالية',
+}
+# Rollups precomputed from the base cube for the national view
+AGG_ROLLUPS = {
+    'gov': ['gov'],
+    'gov_sec': ['gov', 'sec'],
+    'status': ['survey_review_status'],
+    'comcode': ['comcode'],
+}
+
+def dataset_version(file_name, base_path):
+    info = os.stat(os.path.join(base_path, file_name))
+    return f"{info.st_mtime_ns}-{info.st_size}"
+
+def rollup(cube, dims):
+    measures = [c for c in cube.columns if c not in AGG_DIMS]
+    return cube.groupby(dims, sort=False)[measures].sum().reset_index().sort_values('count', ascending=False)
+
+def _build_aggregates(file_name, base_path):
+    path = os.path.join(base_path, file_name)
+    # Attribute-only read: skipping geometry keeps the national scan cheap
+    df = read_gpkg_attributes(path, AGG_DIMS + AGG_AREAS + ['accepted_date'])
+    dims = [c for c in AGG_DIMS if c in df.columns]
+    areas = [c for c in AGG_AREAS if c in df.columns]
+    for col in dims:
+        df[col] = df[col].fillna('غير محدد').astype(str)
+    for col in areas:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Base cube: one row per (gov, sec, status, comcode) - every other view rolls up from it
+    cube = df.groupby(dims, sort=False).agg(count=(dims[0], 'size'), **{a: (a, 'sum') for a in areas}).reset_index()
+    for col in AGG_DIMS:
+        if col not in cube.columns: cube[col] = 'غير محدد'
+
+    # Monthly throughput (accepted requests per gov per month)
+    if 'accepted_date' in df.columns:
+        # GeoPackage stores dates as ISO text in mixed variants (date-only, with/without ms, 'Z')
+        accepted_at = pd.to_datetime(df['accepted_date'], format='ISO8601', utc=True, errors='coerce').dt.tz_localize(None)
+        accepted = df.assign(month=accepted_at.dt.to_period('M'))
+        accepted = accepted.dropna(subset=['month'])
+        throughput = accepted.groupby(['gov', 'month']).size().rename('count').reset_index()
+        throughput['month'] = throughput['month'].astype(str)
+    else:
+        throughput = pd.DataFrame(columns=['gov', 'month', 'count'])
+
+    return {
+        'cube': cube,
+        'rollups': {name: rollup(cube, cols) for name, cols in AGG_ROLLUPS.items()},
+        'throughput': throughput,
+    }
+
+def load_status_aggregates(file_name, base_path):
+    store = get_data_store()
+    key = ("aggregates", file_name, base_path, dataset_version(file_name, base_path))
+
+    def _build():
+        # A new version of the file replaces the aggregates of earlier ones
+        store.discard(lambda k: k[:3] == key[:3] and k != key)
+        return _build_aggregates(file_name, base_path)
+    # Keyed by version, so no TTL: rebuilt only when the file itself changes
+    return store.get(key, _build, ttl=None)
+
+def render_analytics(target_file):
+    with st.spinner("⏳ جاري تجهيز الإحصائيات..."):
+        aggs = load_status_aggregates(target_file, ASSETS_PATH)
+    cube, throughput = aggs['cube'], aggs['throughput']
+
+    govs = sorted(cube['gov'].unique())
+    sel_gov = st.selectbox("🏛️ المحافظة", ["عرض الكل"] + govs, key="analytics_gov")
+    if sel_gov == "عرض الكل":
+        rollups = aggs['rollups']
+        by_area = rollups['gov']
+    else:
+        # Filtered views roll up from the (small) cube on the fly
+        cube = cube[cube['gov'] == sel_gov]
+        throughput = throughput[throughput['gov'] == sel_gov]
+        rollups = {name: rollup(cube, cols) for name, cols in AGG_ROLLUPS.items()}
+        by_area = rollups['gov_sec']
+
+    area_col = next((c for c in ['totalarea', 'area_land', 'area_build'] if c in cube.columns), None)
+    m1, m2, m3 = st.columns(3)
+    m1.metric("📦 إجمالي الطلبات", f"{int(cube['count'].sum()):,}")
+    m2.metric("✅ مقبول", f"{int(cube.loc[cube['survey_review_status'].str.contains('مقبول'), 'count'].sum()):,}")
+    if area_col:
+        m3.metric(f"📐 {AGG_LABELS[area_col]}", f"{cube[area_col].sum():,.0f}")
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("📊 حسب حالة المراجعة")
+        st.bar_chart(rollups['status'].set_index('survey_review_status')['count'])
+    with c2:
+        st.subheader("📈 معدل القبول الشهري")
+        st.line_chart(throughput.groupby('month')['count'].sum())
+
+    st.subheader("🗂️ حسب المحافظة / القسم")
+    st.dataframe(by_area.rename(columns=AGG_LABELS), use_container_width=True, hide_index=True)
+    st.subheader("🏢 حسب الشركة")
+    st.dataframe(rollups['comcode'].rename(columns=AGG_LABELS), use_container_width=True, hide_index=True)
+
+# 7. Main App
 def main():
     # 0. Handle Query Params (Legacy Support - Can be removed)
     if "clear_selection" in st.query_params:
@@ -298,60 +438,33 @@ def main():
         st.query_params.clear()
         # st.rerun() # No need to force rerun if we handle via button now
 
+    # Instance diagnostics (?diagnostics) - shared cache entries and active sessions on this instance
+    if "diagnostics" in st.query_params:
+        with st.expander("🩺 Diagnostics", expanded=True):
+            st.json(get_data_store().stats())
+
     # Top Bar
     st.markdown('<div class="top-header">مستعرض الخرائط (الماسة كونسلت)</div>', unsafe_allow_html=True)
 
     # Title
     st.markdown('<div class="main-title">El Massa Consult - Shapefile View <span class="status-dot"></span></div>', unsafe_allow_html=True)
 
-    files = [f for f in os.listdir(ASSETS_PATH) if f.endswith('.gpkg')] if os.path.exists(ASSETS_PATH) else []
+    files = list(DATA_FILES)
     if not files:
         st.error("⚠️ ملفات البيانات غير موجودة.")
         return
     
     target_file = files[0]
 
-    st.markdown("""
-        <style>
-        /* Target the specific button by key (partial match or containment) */
-        div[data-testid="stButton"] button {
-             /* Default button styles */
-        }
-        
-        /* Custom class wrapper workaround not possible directly on button, 
-           so we use a container and CSS selector strategy */
-        
-        .overlay-btn-container {
-            position: relative;
-            height: 0;
-            z-index: 99999;
-        }
-        
-        div[data-testid="stHorizontalBlock"] .overlay-btn-container button {
-             /* This specific nested button */
-             position: absolute;
-             top: 240px;  /* Below Zoom (70) + Locate (35) + Draw (70) + margins */
-             left: 10px;  /* Left aligned with standard controls */
-             width: 34px !important;
-             height: 34px !important;
-             border-radius: 4px;
-             border: 2px solid rgba(0,0,0,0.2) !important;
-             background-color: white !important;
-             color: #333 !important;
-             box-shadow: 0 1px 5px rgba(0,0,0,0.65);
-             padding: 0 !important;
-             display: flex;
-             align-items: center;
-             justify-content: center;
-             z-index: 99999;
-        }
-        div[data-testid="stHorizontalBlock"] .overlay-btn-container button:hover {
-             border-color: #d32f2f !important;
-             color: #d32f2f !important;
-             background-color: #f4f4f4 !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    view = st.radio("العرض", ["🗺️ الخريطة", "📊 الإحصائيات"], horizontal=True, label_visibility="collapsed", key="view_mode")
+    if view == "📊 الإحصائيات":
+        try:
+            render_analytics(target_file)
+        except Exception:
+            st.error("🚨 خطأ تقني")
+            st.code(traceback.format_exc())
+        return
+
     
     # --- GLOBAL SEARCH LOGIC ---
     if 'search_query' not in st.session_state: st.session_state.search_query = ""
@@ -365,11 +478,10 @@ def main():
         col1, col2, col3 = st.columns([1, 1, 1.5])
         
         try:
+            # Shared, read-only frame (requestnumber is already a string column) - never mutate it here
             meta_df = load_meta(target_file, ASSETS_PATH)
-            # Ensure requestnumber is string for searching
-            meta_df['requestnumber'] = meta_df['requestnumber'].astype(str)
             
-            govs = sorted(meta_df['gov'].unique())
+            govs = sorted(meta_df['gov'].dropna().unique())
             
             with col3:
                 # Mode Selection
@@ -427,9 +539,10 @@ def main():
                                     bbox = (search_x - buffer, search_y - buffer, search_x + buffer, search_y + buffer)
                                     
                                     with st.spinner("⏳ جاري الكشف عن الموقع..."):
+                                        gis = load_gis_libs()
                                         path = os.path.join(ASSETS_PATH, target_file)
                                         # Read ONLY gov, sec intersecting bbox
-                                        matches = gpd.read_file(path, engine='pyogrio', bbox=bbox, columns=['gov', 'sec', 'requestnumber'])
+                                        matches = gis.gpd.read_file(path, engine='pyogrio', layer=gpkg_layer(path), bbox=bbox, columns=['gov', 'sec', 'requestnumber'])
                                         
                                         st.session_state.custom_marker = [search_y, search_x]
 
@@ -460,7 +573,7 @@ def main():
             
             with col2:
                 if sel_gov != "عرض الكل":
-                    secs = sorted(meta_df[meta_df['gov'] == sel_gov]['sec'].unique())
+                    secs = sorted(meta_df.loc[meta_df['gov'].eq(sel_gov).fillna(False), 'sec'].dropna().unique())
                     current_idx = 0
                     if "search_sec" in st.session_state and st.session_state.search_sec in secs:
                         current_idx = secs.index(st.session_state.search_sec) + 1
@@ -504,21 +617,14 @@ def main():
             # --- Map Processing ---
             if sel_gov != "عرض الكل" and sel_sec != "عرض الكل":
                 with st.spinner("⏳ جاري تحليل خرائط القسم..."):
+                    gis = load_gis_libs()  # first section render pays the GIS import cost, not startup
                     gdf_full, org_crs, org_bounds = load_map_data(target_file, ASSETS_PATH, sel_gov, sel_sec)
                 
                 if not gdf_full.empty:
                     
-                    # 1. Memory Optimization for Folium
+                    # 1. Memory Optimization for Folium (shared simplified copy, built once per section)
+                    gdf_map = load_map_view(target_file, ASSETS_PATH, sel_gov, sel_sec)
 
-                    # 1. Memory Optimization for Folium
-                    # We create a lightweight copy ONLY for the map to prevent ArrayMemoryError
-                    keep_map_cols = ['requestnumber', 'survey_review_status', 'accepted_date', 'status_color', 'geometry']
-                    gdf_map = gdf_full[[c for c in keep_map_cols if c in gdf_full.columns]].copy()
-                    # Micro-simplification (0.00001 is ~1m). Preserves look, saves RAM.
-                    gdf_map['geometry'] = gdf_map['geometry'].simplify(0.00001, preserve_topology=True)
-
-
-                    
                     # Default Center (Mean of Data)
                     default_center = [gdf_map.geometry.centroid.y.mean(), gdf_map.geometry.centroid.x.mean()]
                     
@@ -549,7 +655,7 @@ def main():
                             zoom = 21
                         st.session_state.target_req = None
 
-                    m = folium.Map(location=center, zoom_start=zoom, tiles=None, max_zoom=22)
+                    m = gis.folium.Map(location=center, zoom_start=zoom, tiles=None, max_zoom=22)
 
                     # Apply Fit Bounds (Must be after map init)
                     if "custom_center" in st.session_state:
@@ -565,20 +671,20 @@ def main():
                     
                     # Add Custom Marker if exists (Searched Location)
                     if "custom_marker" in st.session_state and st.session_state.custom_marker:
-                         folium.Marker(
+                         gis.folium.Marker(
                             location=st.session_state.custom_marker,
                             popup="📍 موقع البحث",
-                            icon=folium.Icon(color="red", icon="map-marker", prefix='fa')
+                            icon=gis.folium.Icon(color="red", icon="map-marker", prefix='fa')
                         ).add_to(m)
-                    LocateControl(auto_start=False).add_to(m)
-                    Fullscreen(position='topright', title='ملء الشاشة', title_cancel='إغلاق', force_separate_button=True).add_to(m)
+                    gis.LocateControl(auto_start=False).add_to(m)
+                    gis.Fullscreen(position='topright', title='ملء الشاشة', title_cancel='إغلاق', force_separate_button=True).add_to(m)
                     
                     # Add Clear Selection Button (Custom Control) - DISABLED temporarily for debug
                     # if st.session_state.selected_requests or "custom_marker" in st.session_state or "custom_center" in st.session_state:
-                    #      ClearButton().add_to(m)
+                    #      make_clear_button().add_to(m)
                     
                     # Add ONLY Google Satellite (no OpenStreetMap)
-                    folium.TileLayer(
+                    gis.folium.TileLayer(
                         tiles="https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}",
                         attr="Google Satellite",
                         name="Satellite View",
@@ -587,7 +693,7 @@ def main():
                         control=False  # Hide layer control since we only have one layer
                     ).add_to(m)
 
-                    Draw(
+                    gis.Draw(
                         draw_options={
                             'polyline': False, 'circle': False, 'marker': False, 
                             'circlemarker': False, 'rectangle': True, 'polygon': True
@@ -595,7 +701,7 @@ def main():
                         edit_options={'edit': False, 'remove': False}
                     ).add_to(m)
 
-                    folium.GeoJson(
+                    gis.folium.GeoJson(
                         gdf_map,
                         style_function=lambda f: {
                             'fillColor': f['properties'].get('status_color'),
@@ -603,7 +709,7 @@ def main():
                             'weight': 5 if str(f['properties'].get('requestnumber')) in st.session_state.selected_requests else 1,
                             'fillOpacity': 0.9 if str(f['properties'].get('requestnumber')) in st.session_state.selected_requests else 0.7
                         },
-                        tooltip=folium.GeoJsonTooltip(
+                        tooltip=gis.folium.GeoJsonTooltip(
                             fields=['requestnumber', 'survey_review_status', 'accepted_date'],
                             aliases=['الطلب:', 'الحالة:', 'التاريخ:'], localize=True
                         )
@@ -623,7 +729,7 @@ def main():
                              st.rerun()
                          st.markdown('</div>', unsafe_allow_html=True)
 
-                    map_out = st_folium(m, height=520, width='100%', key="main_map")
+                    map_out = gis.st_folium(m, height=520, width='100%', key="main_map")
 
                     # 3. Handle Map Interaction
                     
@@ -634,7 +740,7 @@ def main():
                         # Process the latest drawing
                         last_draw = new_drawings[-1] # Get most recent
                         if "geometry" in last_draw:
-                            draw_geom = shape(last_draw["geometry"])
+                            draw_geom = gis.shape(last_draw["geometry"])
                             # Find all request numbers within the drawing
                             # Intersection check
                             mask = gdf_full.geometry.apply(lambda x: draw_geom.contains(x) or x.intersects(draw_geom))
@@ -0,0 +1,88 @@
+"""Startup benchmark for app.py (cold start on Cloud Run scale-to-zero).
+
+Every measurement runs in a fresh interpreter so nothing is warm:
+  1. import time of each heavy library on its own
+  2. first paint: a full first run of app.py through Streamlit's AppTest,
+     once with deferred GIS imports (default) and once with GIS_EAGER_IMPORTS=1
+
+Usage:
+    python bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ["streamlit", "pandas", "pyogrio", "geopandas", "shapely", "pyproj",
+                 "folium", "streamlit_folium", "branca", "jinja2"]
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import {module}
+print(time.perf_counter() - t)
+"""
+
+FIRST_PAINT_SNIPPET = """
+import json, sys, time
+t = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=300).run()
+print(json.dumps({
+    "seconds": time.perf_counter() - t,
+    "errors": [e.value for e in at.error],
+    "gis_loaded": [m for m in ("geopandas", "pyogrio", "shapely", "folium") if m in sys.modules],
+}))
+"""
+
+
+def run_python(code, env=None):
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+def time_imports(runs):
+    results = {}
+    for module in HEAVY_MODULES:
+        try:
+            samples = [float(run_python(IMPORT_SNIPPET.format(module=module))) for _ in range(runs)]
+        except subprocess.CalledProcessError:
+            results[module] = None  # not installed
+            continue
+        results[module] = statistics.median(samples)
+    return results
+
+
+def time_first_paint(runs, eager):
+    env = dict(os.environ, GIS_EAGER_IMPORTS="1" if eager else "0")
+    samples = [json.loads(run_python(FIRST_PAINT_SNIPPET, env=env)) for _ in range(runs)]
+    return {
+        "median_seconds": statistics.median(s["seconds"] for s in samples),
+        "gis_loaded": samples[-1]["gis_loaded"],
+        "errors": samples[-1]["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    args = parser.parse_args()
+
+    print("== import time (median, seconds) ==")
+    for module, seconds in time_imports(args.runs).items():
+        print(f"{module:<18} {'not installed' if seconds is None else f'{seconds:.3f}'}")
+
+    print("\n== first paint (median, seconds) ==")
+    for label, eager in (("deferred", False), ("eager", True)):
+        res = time_first_paint(args.runs, eager)
+        print(f"{label:<10} {res['median_seconds']:.3f}  gis loaded: {res['gis_loaded'] or '-'}")
+        for err in res["errors"]:
+            print(f"           error: {err}")
+
+
+if __name__ == "__main__":
+    main()